@@ -1,69 +1,61 @@
 import os
-import hashlib
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import re
+import glob
 import time
+import argparse
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve as sv
+import lxml.html
+from lxml import etree
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
 import traceback
-import concurrent.futures
-from dateutil.parser import parse
+from ufc_cache import new_session, get_html, bounded_map, clear_memo, flush
 
 BASE = "http://ufcstats.com"
-CACHE_DIR = "cache_html"
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-def cache_path(url: str):
-    """Convert URL to md5 hashed cache filename."""
-    h = hashlib.md5(url.encode()).hexdigest()
-    return os.path.join(CACHE_DIR, f"{h}.html")
-
-
-def fetch_cached(url: str):
-    """
-    Return HTML from cache if available.
-    Otherwise download and save it.
-    """
-    path = cache_path(url)
-
-    # Return cached HTML if exists
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-
-    # Otherwise download
-    headers = {
-        # Change this to your user agent
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/123.0 Safari/537.36"
-        )
-    }
 
-    for _ in range(5):
-        try:
-            r = requests.get(url, headers=headers, timeout=12)
-            if r.status_code == 200:
-                html = r.text
-                # save to cache
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(html)
-                return html
-            else:
-                print(f"[WARN] Status {r.status_code} for {url}")
-        except Exception as e:
-            print(f"[WARN] Error fetching {url}: {e}")
-
-    print(f"[ERROR] Failed to fetch {url}")
-    return None
-
-
-def get_soup(url):
+STAT_LABELS = ["KD", "SIG_STR", "SIG_STR_pct", "TOTAL_STR",
+               "TD", "TD_pct", "SUB_ATT", "REV", "CTRL"]
+
+# Fixed schema so every checkpoint batch appends to the same Parquet file
+FIGHT_SCHEMA = pa.schema(
+    [("fight_url", pa.string()), ("event_url", pa.string()), ("date", pa.date32())]
+    + [(c, pa.string()) for c in ["winner", "red_name", "blue_name", "method", "round", "time"]]
+    + [(f"{side}_{label}", pa.string()) for label in STAT_LABELS for side in ("red", "blue")]
+)
+# Each run checkpoints into its own partial file; the final save folds them into the CSV
+PARTIAL_GLOB = "ufc_fights_partial_*.parquet"
+FINAL_CSV = "ufc_fight_data.csv"
+
+# Strainers so each page only builds the subtrees its parser reads
+FIGHT_HEADER = SoupStrainer(class_=[
+    "b-content__title", "b-fight-details__person", "b-fight-details__content"
+])
+
+# Totals rows straight from libxml2 instead of a Python-callable bs4 find
+TOTALS_ROWS = etree.XPath("(//p[contains(., 'Totals')])[1]/following::table[1]//tbody/tr")
+
+# CSS selectors compiled once instead of on every parse_fight call
+SEL_EVENT_LINK = sv.compile("a.b-fight-details__event-link")
+SEL_PERSON = sv.compile("div.b-fight-details__person")
+SEL_PERSON_NAME = sv.compile("h3.b-fight-details__person-name")
+SEL_PERSON_STATUS = sv.compile("i.b-fight-details__person-status")
+SEL_CONTENT = sv.compile("div.b-fight-details__content")
+SEL_METHOD = sv.compile("i.b-fight-details__text-item_first")
+SEL_TEXT_ITEM = sv.compile("i.b-fight-details__text-item")
+
+
+async def get_soup(session, url, parse_only=None, refresh=False):
     """Return BeautifulSoup object using cached HTML."""
-    html = fetch_cached(url)
+    html = await get_html(session, url, refresh)
     if html is None:
         return None
-    return BeautifulSoup(html, "html.parser")
+    return BeautifulSoup(html, "lxml", parse_only=parse_only)
 
 
 def normalize_url(href):
@@ -80,59 +72,59 @@ def normalize_url(href):
     return BASE + "/" + href
 
 
-def get_all_event_links():
+# Listing pages are only scanned for links, so skip building a DOM for them
+EVENT_RE = re.compile(r'href="([^"]*event-details[^"]*)"')
+FIGHT_RE = re.compile(r'href="([^"]*fight-details[^"]*)"')
+DATE_RE = re.compile(r'Date:\s*</i>\s*([^<]*?)\s*</li>')
+
+
+async def get_all_event_links(session, refresh=False):
     """Returns all event detail pages."""
     url = f"{BASE}/statistics/events/completed?page=all"
-    soup = get_soup(url)
-    if soup is None:
+    html = await get_html(session, url, refresh)
+    if html is None:
         print("[ERROR] Could not load events page.")
         return []
 
-    events = set()
-
-    for a in soup.find_all("a", href=True):
-        if "event-details" in a["href"]:
-            events.add(normalize_url(a["href"]))
+    events = {normalize_url(href) for href in EVENT_RE.findall(html)}
 
     events = sorted(events)
     print(f"[OK] Found {len(events)} events")
     return events
 
 
-def get_event_fights(event_url):
-    """Return all fight URLs from an event page."""
-    soup = get_soup(event_url)
-    if soup is None:
-        return []
+def parse_event_date(html):
+    """Return the raw "Month DD, YYYY" date from an event page's info box, or None."""
+    m = DATE_RE.search(html)
+    return m.group(1) if m else None
 
-    fights = set()
 
-    for a in soup.select("tr.b-fight-details__table-row a[href*='fight-details']"):
-        fights.add(normalize_url(a["href"]))
+async def get_event_fights(session, event_url, refresh=False):
+    """Return (event date, fight URLs) from an event page."""
+    html = await get_html(session, event_url, refresh)
+    if html is None:
+        return None, []
 
-    if not fights:  # fallback
-        for a in soup.find_all("a", href=True):
-            if "fight-details" in a["href"]:
-                fights.add(normalize_url(a["href"]))
+    # Only the fight table rows link to fight-details on an event page
+    fights = {normalize_url(href) for href in FIGHT_RE.findall(html)}
 
     fights = sorted(fights)
     print(f"Event {event_url} | {len(fights)} fights")
-    return fights
+    return parse_event_date(html), fights
 
 
 def safe_text(t):
     return t.get_text(strip=True) if t else None
 
-def parse_fight(fight_url):
-    soup = get_soup(fight_url)
-    if soup is None:
-        return None
+def parse_fight_html(fight_url, html):
+    """Pure-CPU half of parse_fight; picklable so it can run in a worker process."""
+    soup = BeautifulSoup(html, "lxml", parse_only=FIGHT_HEADER)
 
     # --------------------------------------
     # Event link
     # --------------------------------------
     event_url = None
-    event_link = soup.select_one("a.b-fight-details__event-link")
+    event_link = SEL_EVENT_LINK.select_one(soup)
     if event_link:
         event_url = normalize_url(event_link.get("href"))
     else:
@@ -140,54 +132,34 @@ def parse_fight(fight_url):
         if alt:
             event_url = normalize_url(alt["href"])
 
-    # --------------------------------------
-    # Event date
-    # --------------------------------------
-    date = None
-    if event_url:
-        event_soup = get_soup(event_url)
-        if event_soup:
-            try:
-                label = event_soup.find(
-                    "i",
-                    class_="b-list__box-item-title",
-                    string=lambda x: x and "Date" in x
-                )
-                if label:
-                    raw = label.parent.get_text(" ", strip=True)
-                    raw = raw.replace("Date:", "").strip()
-                    date = parse(raw, fuzzy=True).date()
-            except:
-                pass
-
     # --------------------------------------
     # Fighters + Winner
     # --------------------------------------
-    persons = soup.select("div.b-fight-details__person")
+    persons = SEL_PERSON.select(soup)
     if len(persons) != 2:
         print("Bad fighter structure:", fight_url)
         return None
 
-    red_name = safe_text(persons[0].select_one("h3.b-fight-details__person-name"))
-    blue_name = safe_text(persons[1].select_one("h3.b-fight-details__person-name"))
+    red_name = safe_text(SEL_PERSON_NAME.select_one(persons[0]))
+    blue_name = safe_text(SEL_PERSON_NAME.select_one(persons[1]))
 
-    red_status = safe_text(persons[0].select_one("i.b-fight-details__person-status")) or ""
-    blue_status = safe_text(persons[1].select_one("i.b-fight-details__person-status")) or ""
+    red_status = safe_text(SEL_PERSON_STATUS.select_one(persons[0])) or ""
+    blue_status = safe_text(SEL_PERSON_STATUS.select_one(persons[1])) or ""
 
     winner = "red" if red_status == "W" else "blue" if blue_status == "W" else "none"
 
     # --------------------------------------
     # Method / Round / Time
     # --------------------------------------
-    fight_info = soup.select_one("div.b-fight-details__content")
+    fight_info = SEL_CONTENT.select_one(soup)
     method = round_ = time_ = None
 
     if fight_info:
-        method_tag = fight_info.select_one("i.b-fight-details__text-item_first")
+        method_tag = SEL_METHOD.select_one(fight_info)
         if method_tag:
             method = method_tag.text.replace("Method:", "").strip()
 
-        for item in fight_info.select("i.b-fight-details__text-item"):
+        for item in SEL_TEXT_ITEM.select(fight_info):
             t = item.text.strip()
             if t.startswith("Round:"):
                 round_ = t.replace("Round:", "").strip()
@@ -197,25 +169,21 @@ def parse_fight(fight_url):
     # --------------------------------------
     # Totals table
     # --------------------------------------
-    totals_section = soup.find("p", text=lambda x: x and "Totals" in x)
-    if not totals_section:
+    rows = TOTALS_ROWS(lxml.html.fromstring(html))
+    if not rows:
         print("Totals section missing:", fight_url)
         return None
 
-    totals_table = totals_section.find_next("table")
-    rows = totals_table.select("tbody tr")
-
-    labels = ["KD", "SIG_STR", "SIG_STR_pct", "TOTAL_STR",
-              "TD", "TD_pct", "SUB_ATT", "REV", "CTRL"]
+    labels = STAT_LABELS
 
     stats = {}
 
     if len(rows) == 1:
-        tds = rows[0].find_all("td")[1:]
+        tds = rows[0].findall("td")[1:]
         for i, td in enumerate(tds):
-            ps = td.find_all("p")
-            red = ps[0].text.strip() if len(ps) else None
-            blue = ps[1].text.strip() if len(ps) > 1 else None
+            ps = td.findall(".//p")
+            red = ps[0].text_content().strip() if len(ps) else None
+            blue = ps[1].text_content().strip() if len(ps) > 1 else None
             stats[f"red_{labels[i]}"] = red
             stats[f"blue_{labels[i]}"] = blue
     else:
@@ -225,7 +193,7 @@ def parse_fight(fight_url):
     return {
         "fight_url": fight_url,
         "event_url": event_url,
-        "date": date,
+        "date": None,
         "winner": winner,
         "red_name": red_name,
         "blue_name": blue_name,
@@ -236,49 +204,144 @@ def parse_fight(fight_url):
     }
 
 
-def scrape_all(save_every=1000, threads=30):
-    events = get_all_event_links()
-
-    fight_links = set()
-    for e in events:
-        for f in get_event_fights(e):
-            fight_links.add(f)
-
-    fight_links = sorted(fight_links)
-    print(f"[+] Total fight links: {len(fight_links)}")
-
-    data = []
+async def parse_fight(session, fight_url, event_date_map, pool=None, refresh=False):
+    """Fetch a fight page on the event loop and parse it in `pool`."""
+    html = await get_html(session, fight_url, refresh)
+    if html is None:
+        return None
 
-    # ----------------------------
-    # Threaded scraping
-    # ----------------------------
-    print(f"[+] Starting multithreaded scrape with {threads} workers...")
+    loop = asyncio.get_running_loop()
+    row = await loop.run_in_executor(pool, parse_fight_html, fight_url, html)
+    if row:
+        # Event date was already read from the event page
+        row["date"] = event_date_map.get(row["event_url"])
+    return row
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {executor.submit(parse_fight, url): url for url in fight_links}
 
-        for i, future in enumerate(concurrent.futures.as_completed(futures)):
-            url = futures[future]
+def readable_partials():
+    """Partial files with a complete footer; a run killed outright can leave one without."""
+    paths = []
+    for path in sorted(glob.glob(PARTIAL_GLOB)):
+        try:
+            pq.read_metadata(path)
+        except pa.ArrowInvalid:
+            print(f"[WARN] Ignoring unreadable partial {path}")
+            continue
+        paths.append(path)
+    return paths
+
+
+def load_done_fights():
+    """Return fight URLs already saved in the final CSV or a leftover partial file."""
+    done = set()
+    if os.path.exists(FINAL_CSV):
+        opts = pacsv.ConvertOptions(include_columns=["fight_url"])
+        done.update(pacsv.read_csv(FINAL_CSV, convert_options=opts).column("fight_url").to_pylist())
+    for path in readable_partials():
+        done.update(pq.read_table(path, columns=["fight_url"]).column("fight_url").to_pylist())
+    return done
+
+
+def iter_fight_links(event_results, done=()):
+    """Lazily chain each event's fight links, skipping done or already seen ones."""
+    seen = set(done)
+    for _, fights in event_results:
+        for f in fights:
+            if f not in seen:
+                seen.add(f)
+                yield f
+
+
+def write_final_csv():
+    """Append every readable partial to the final CSV, then drop the partials."""
+    partials = readable_partials()
+
+    tmp = FINAL_CSV + ".tmp"
+    with pacsv.CSVWriter(tmp, FIGHT_SCHEMA) as out:
+        if os.path.exists(FINAL_CSV):
+            opts = pacsv.ConvertOptions(column_types=FIGHT_SCHEMA, strings_can_be_null=True)
+            for b in pacsv.open_csv(FINAL_CSV, convert_options=opts):
+                out.write_table(pa.Table.from_batches([b]).select(FIGHT_SCHEMA.names).cast(FIGHT_SCHEMA))
+        # batch by batch, never the whole table at once
+        for path in partials:
+            with pq.ParquetFile(path) as pf:
+                for b in pf.iter_batches():
+                    out.write_batch(b)
+    os.replace(tmp, FINAL_CSV)
+
+    for path in partials:
+        os.remove(path)
+
+
+async def _scrape_all(save_every, concurrency, refresh):
+    clear_memo()
+    async with new_session() as session:
+        events = await get_all_event_links(session, refresh)
+        results = await asyncio.gather(*[get_event_fights(session, e, refresh) for e in events])
+
+        # One vectorized parse instead of a dateutil call per event
+        raw_dates = pd.Series([date for date, _ in results], index=events, dtype=object)
+        parsed = pd.to_datetime(raw_dates, format="%B %d, %Y", errors="coerce")
+        event_date_map = {e: d.date() for e, d in parsed.dropna().items()}
+
+        done = load_done_fights()
+        print(f"[+] Total fight links: {sum(len(fights) for _, fights in results)}"
+              f" ({len(done)} already scraped)")
+
+        # ----------------------------
+        # Concurrent scraping
+        # ----------------------------
+        print(f"[+] Starting async scrape with {concurrency} in flight...")
+
+        async def safe_parse(url):
             try:
-                result = future.result()
-                if result:
-                    data.append(result)
+                return await parse_fight(session, url, event_date_map, pool, refresh)
             except Exception as e:
                 print(f"[ERROR] scrape failed {url}", e)
                 traceback.print_exc()
+                return None
+
+        # Rows stream straight from the workers into the Parquet checkpoints;
+        # parsing is CPU-bound, so it runs across processes to escape the GIL.
+        # Workers are spawned, not forked: by now the cache writer and aiohttp's
+        # resolver threads are running, and forking a threaded process can deadlock.
+        batch = []
+        saved = 0
+        partial_path = PARTIAL_GLOB.replace("*", str(int(time.time())))
+        todo = iter_fight_links(results, done)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=ctx) as pool, \
+                pq.ParquetWriter(partial_path, FIGHT_SCHEMA, compression="zstd") as writer:
+            async for result in bounded_map(safe_parse, todo, concurrency):
+                if result:
+                    batch.append(result)
+
+                if len(batch) >= save_every:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=FIGHT_SCHEMA))
+                    saved += len(batch)
+                    batch.clear()
+                    print(f"[+] Saved partial ({saved})")
 
-            if (i + 1) % save_every == 0:
-                df = pd.DataFrame(data)
-                df.to_csv(f"ufc_fights_partial_{i+1}.csv", index=False)
-                print(f"[+] Saved partial ({i+1})")
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=FIGHT_SCHEMA))
+
+    # Persist queued pages and cache index now; atexit is only a backstop
+    flush()
 
     # ----------------------------
     # Final save
     # ----------------------------
-    df = pd.DataFrame(data)
-    df.to_csv("ufc_fight_data.csv", index=False)
-    print("[+] Saved ufc_fight_data.csv")
+    write_final_csv()
+    print(f"[+] Saved {FINAL_CSV}")
+
+
+def scrape_all(save_every=1000, concurrency=30, refresh=False):
+    asyncio.run(_scrape_all(save_every, concurrency, refresh))
 
 
 if __name__ == "__main__":
-    scrape_all()
+    parser = argparse.ArgumentParser(description="Scrape UFC fight stats from ufcstats.com")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revalidate cached pages with conditional GETs")
+    args = parser.parse_args()
+    scrape_all(refresh=args.refresh)
@@ -1,27 +1,36 @@
-import requests
+import asyncio
+import argparse
+import traceback
 from bs4 import BeautifulSoup
-import pandas as pd
-import time
+import soupsieve as sv
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
+from ufc_cache import new_session, get_html, bounded_map, clear_memo, flush
 
 BASE = "http://ufcstats.com"
 
-def get_soup(url):
-    headers = {
-        #Change this to your user agent
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                      "AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/123.0 Safari/537.36"
-    }
-    for _ in range(5):
-        try:
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.status_code == 200:
-                return BeautifulSoup(r.text, "html.parser")
-        except:
-            pass
-        time.sleep(1)
-    print(f"[ERROR] Could not fetch {url}")
-    return None
+FIGHTER_SCHEMA = pa.schema([(c, pa.string()) for c in [
+    "fighter_url", "name", "record", "height", "weight", "reach", "stance", "dob",
+    "SLpM", "SApM", "Str_Acc", "Str_Def", "TD_Avg", "TD_Acc", "TD_Def", "Sub_Avg",
+]])
+PARTIAL_PATH = "ufc_fighter_data_partial.parquet"
+
+# CSS selectors compiled once instead of on every parse_fighter call
+SEL_FIGHTER_LINK = sv.compile("a.b-link.b-link_style_black[href*='fighter-details']")
+SEL_NAME = sv.compile("span.b-content__title-highlight")
+SEL_RECORD = sv.compile("span.b-content__title-record")
+SEL_INFO = sv.compile("div.b-list__info-box ul.b-list__box-list li")
+SEL_INFO_TITLE = sv.compile("i.b-list__box-item-title")
+SEL_LEFT_STATS = sv.compile("div.b-list__info-box-left li")
+SEL_RIGHT_STATS = sv.compile("div.b-list__info-box-right li")
+
+
+async def get_soup(session, url, refresh=False):
+    html = await get_html(session, url, refresh)
+    if html is None:
+        return None
+    return BeautifulSoup(html, "lxml")
 
 
 # ------------------------------------------------------------
@@ -43,17 +52,18 @@ def normalize_url(href):
 # ------------------------------------------------------------
 # GET ALL FIGHTERS (A–Z)
 # ------------------------------------------------------------
-def get_all_fighter_links():
+async def get_all_fighter_links(session, refresh=False):
     chars = "abcdefghijklmnopqrstuvwxyz"
     fighter_links = set()
 
-    for c in chars:
-        url = f"{BASE}/statistics/fighters?char={c}&page=all"
-        soup = get_soup(url)
+    urls = [f"{BASE}/statistics/fighters?char={c}&page=all" for c in chars]
+    soups = await asyncio.gather(*[get_soup(session, url, refresh) for url in urls])
+
+    for c, soup in zip(chars, soups):
         if not soup:
             continue
 
-        for a in soup.select("a.b-link.b-link_style_black[href*='fighter-details']"):
+        for a in SEL_FIGHTER_LINK.select(soup):
             fighter_links.add(normalize_url(a["href"]))
 
         print(f"Loaded {c.upper()} — Total so far: {len(fighter_links)}")
@@ -64,75 +74,67 @@ def get_all_fighter_links():
 # ------------------------------------------------------------
 # PARSE SINGLE FIGHTER PAGE
 # ------------------------------------------------------------
-def parse_fighter(url):
-    soup = get_soup(url)
+def stat_map(items):
+    """Map "Label: value" list items to {label: value} in one pass."""
+    stats = {}
+    for li in items:
+        label, sep, value = li.text.strip().partition(":")
+        if sep:
+            stats[label.strip()] = value.strip()
+    return stats
+
+
+async def parse_fighter(session, url, refresh=False):
+    soup = await get_soup(session, url, refresh)
     if not soup:
         return None
 
     # ---------------------------
     # NAME + RECORD
     # ---------------------------
-    name = soup.select_one("span.b-content__title-highlight")
+    name = SEL_NAME.select_one(soup)
     name = name.text.strip() if name else None
 
-    record = soup.select_one("span.b-content__title-record")
+    record = SEL_RECORD.select_one(soup)
     record = record.text.replace("Record:", "").strip() if record else None
 
     # ---------------------------
     # PERSONAL INFO (Height, Weight, Reach, Stance, DOB)
     # ---------------------------
-    info = soup.select("div.b-list__info-box ul.b-list__box-list li")
-
-    def extract(label):
-        for li in info:
-            title = li.select_one("i.b-list__box-item-title")
-            if not title:
-                continue
-            if title.text.strip().lower().startswith(label.lower()):
-                # Value is the remaining text after the label
-                raw = li.text.replace(title.text, "").strip()
-                return raw if raw != "" else None
-        return None
+    info_map = {}
+    for li in SEL_INFO.select(soup):
+        title = SEL_INFO_TITLE.select_one(li)
+        if not title:
+            continue
+        # Value is the remaining text after the label
+        label = title.text.strip().rstrip(":").lower()
+        info_map[label] = li.text.replace(title.text, "").strip()
 
-    height = extract("Height")
-    weight = extract("Weight")
-    reach = extract("Reach")
-    stance = extract("STANCE")
-    dob = extract("DOB")
+    height = info_map.get("height") or None
+    weight = info_map.get("weight") or None
+    reach = info_map.get("reach") or None
+    stance = info_map.get("stance") or None
+    dob = info_map.get("dob") or None
 
     # ---------------------------
     # CAREER STATS (Left Side)
     # ---------------------------
-    left_stats = soup.select("div.b-list__info-box-left li")
+    left = stat_map(SEL_LEFT_STATS.select(soup))
 
-    def get_left(prefix):
-        for li in left_stats:
-            t = li.text.strip()
-            if t.startswith(prefix):
-                return t.replace(prefix, "").strip()
-        return None
-
-    SLpM     = get_left("SLpM:")
-    Str_Acc  = get_left("Str. Acc.:")
-    SApM     = get_left("SApM:")
-    Str_Def  = get_left("Str. Def.")
+    SLpM     = left.get("SLpM")
+    Str_Acc  = left.get("Str. Acc.")
+    SApM     = left.get("SApM")
+    Str_Def  = left.get("Str. Def")
 
     # ---------------------------
     # CAREER STATS (Right Side)
     # ---------------------------
-    right_stats = soup.select("div.b-list__info-box-right li")
-
-    def get_right(prefix):
-        for li in right_stats:
-            t = li.text.strip()
-            if t.startswith(prefix):
-                return t.replace(prefix, "").strip()
-        return None
+    right = stat_map(SEL_RIGHT_STATS.select(soup))
 
-    TD_Avg   = get_right("TD Avg.:")
-    TD_Acc   = get_right("TD Acc.:")
-    TD_Def   = get_right("TD Def.:")
-    Sub_Avg  = get_right("Sub. Avg.:")
+    TD_Avg   = right.get("TD Avg.")
+    TD_Acc   = right.get("TD Acc.")
+    TD_Def   = right.get("TD Def.")
+    Sub_Avg  = right.get("Sub. Avg.")
 
     return {
         "fighter_url": url,
@@ -157,28 +159,56 @@ def parse_fighter(url):
 # ------------------------------------------------------------
 # MAIN SCRAPER
 # ------------------------------------------------------------
-def scrape_fighters(save_every=1000):
-    fighter_links = get_all_fighter_links()
-    print(f"[+] Found {len(fighter_links)} fighters")
-
-    data = []
-    for i, url in enumerate(fighter_links, start=1):
-        print(f"[{i}/{len(fighter_links)}] {url}")
-        info = parse_fighter(url)
-        if info:
-            data.append(info)
-        time.sleep(0.1)
-        
-        if (i + 1) % save_every == 0:
-            df_partial = pd.DataFrame(data)
-            partial_name = f"ufc_fighter_data_partial_{i+1}.csv"
-            df_partial.to_csv(partial_name, index=False)
-            print(f"[+] Saved partial CSV: {partial_name} (fights scraped: {i+1})")
-
-    df = pd.DataFrame(data)
-    df.to_csv("ufc_fighter_stats.csv", index=False)
+async def _scrape_fighters(save_every, concurrency, refresh):
+    clear_memo()
+    async with new_session() as session:
+        fighter_links = await get_all_fighter_links(session, refresh)
+        print(f"[+] Found {len(fighter_links)} fighters")
+
+        async def safe_parse(url):
+            try:
+                return await parse_fighter(session, url, refresh)
+            except Exception as e:
+                print(f"[ERROR] scrape failed {url}", e)
+                traceback.print_exc()
+                return None
+
+        batch = []
+        saved = 0
+        with pq.ParquetWriter(PARTIAL_PATH, FIGHTER_SCHEMA, compression="zstd") as writer:
+            i = 0
+            async for info in bounded_map(safe_parse, fighter_links, concurrency):
+                i += 1
+                if info:
+                    batch.append(info)
+                print(f"[{i}/{len(fighter_links)}] {info['fighter_url'] if info else 'failed'}")
+
+                if len(batch) >= save_every:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=FIGHTER_SCHEMA))
+                    saved += len(batch)
+                    batch.clear()
+                    print(f"[+] Saved partial: {PARTIAL_PATH} (fighters scraped: {saved})")
+
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=FIGHTER_SCHEMA))
+
+    # Persist queued pages and cache index now; atexit is only a backstop
+    flush()
+
+    with pq.ParquetFile(PARTIAL_PATH) as pf, \
+            pacsv.CSVWriter("ufc_fighter_stats.csv", pf.schema_arrow) as out:
+        for b in pf.iter_batches():
+            out.write_batch(b)
     print("[+] Saved ufc_fighter_stats.csv")
 
 
+def scrape_fighters(save_every=1000, concurrency=30, refresh=False):
+    asyncio.run(_scrape_fighters(save_every, concurrency, refresh))
+
+
 if __name__ == "__main__":
-    scrape_fighters()
+    parser = argparse.ArgumentParser(description="Scrape UFC fighter stats from ufcstats.com")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revalidate cached pages with conditional GETs")
+    args = parser.parse_args()
+    scrape_fighters(refresh=args.refresh)
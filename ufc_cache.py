@@ -0,0 +1,266 @@
+import os
+import gzip
+import zlib
+import json
+import time
+import hashlib
+import xxhash
+import asyncio
+import atexit
+import queue
+import threading
+from collections import OrderedDict
+import aiohttp
+
+CACHE_DIR = "cache_html"
+INDEX_PATH = os.path.join(CACHE_DIR, "cache_index.json")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+HEADERS = {
+    # Change this to your user agent
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/123.0 Safari/537.36"
+    )
+}
+TIMEOUT = aiohttp.ClientTimeout(total=12)
+
+# Same policy as urllib3's Retry(total=5, backoff_factor=0.3, status_forcelist=...)
+RETRIES = 5
+BACKOFF = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def new_session():
+    """
+    One pooled keep-alive session per run, so TLS/TCP setup is paid once per socket.
+    limit_per_host is the only throttle on the event/index gathers, so it stays
+    at 30 to be polite to ufcstats.
+    """
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=30, ttl_dns_cache=600)
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=TIMEOUT)
+
+
+def cache_path(url: str):
+    """Convert URL to gzipped xxhash64 cache filename, sharded by its first byte."""
+    h = xxhash.xxh64(url.encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, h[:2], f"{h}.html.gz")
+
+
+def legacy_cache_path(url: str):
+    """Flat, uncompressed md5 filename used by older caches; still read, never written."""
+    h = hashlib.md5(url.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{h}.html")
+
+
+# ------------------------------------------------------------
+# CACHE INDEX (url -> {path, fetched_ts, etag, last_modified})
+# ------------------------------------------------------------
+_index = None
+
+
+def get_index():
+    """Load cache_index.json on first use."""
+    global _index
+    if _index is None:
+        try:
+            with open(INDEX_PATH, "r", encoding="utf-8") as f:
+                _index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _index = {}
+    return _index
+
+
+def save_index():
+    """Write the index atomically so a crash never leaves a torn file."""
+    if _index is None:
+        return
+    tmp = INDEX_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_index, f)
+    os.replace(tmp, INDEX_PATH)
+
+
+def read_cached(url: str):
+    """Return cached HTML for url, or None if it was never stored."""
+    entry = get_index().get(url)
+    path = os.path.join(CACHE_DIR, entry["path"]) if entry else cache_path(url)
+
+    # Indexed pages skip the existence checks entirely
+    if entry or os.path.exists(path):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            # Truncated or corrupt entry: drop it so it gets downloaded again
+            print(f"[WARN] Discarding bad cache file {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    legacy = legacy_cache_path(url)
+    if os.path.exists(legacy):
+        with open(legacy, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+
+def _write_cache(path, html):
+    """Write via a .tmp file so readers and crashes never see a partial entry."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(html)
+    os.replace(tmp, path)
+
+
+# Cache writes are drained by one background thread so fetches never wait on disk
+_WRITE_Q = queue.Queue()
+_writer = None
+
+
+def _writer_loop():
+    while True:
+        path, html = _WRITE_Q.get()
+        try:
+            _write_cache(path, html)
+        except OSError as e:
+            print(f"[WARN] Could not cache {path}: {e}")
+        finally:
+            _WRITE_Q.task_done()
+
+
+def queue_cache_write(path, html):
+    """Hand a page to the writer thread, starting it on first use."""
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_writer_loop, daemon=True)
+        _writer.start()
+    _WRITE_Q.put((path, html))
+
+
+def flush():
+    """Wait for queued pages to hit disk, then persist the index."""
+    _WRITE_Q.join()
+    save_index()
+
+
+# Scrapers flush() at the end of each run; this is only a backstop for
+# pages and index entries queued when the interpreter exits some other way
+atexit.register(flush)
+
+
+async def fetch_cached(session, url: str, refresh=False):
+    """
+    Return HTML from cache if available.
+    Otherwise download and save it.
+
+    With refresh=True the page is re-requested with the stored ETag /
+    Last-Modified validators, so an unchanged page comes back as a bodyless
+    304 and the cached copy is reused without rewriting it.
+    """
+    cached = read_cached(url)
+    if cached is not None and not refresh:
+        return cached
+
+    index = get_index()
+    entry = index.get(url, {})
+    headers = {}
+    if cached is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    # Otherwise download
+    for attempt in range(RETRIES):
+        if attempt:
+            await asyncio.sleep(BACKOFF * 2 ** (attempt - 1))
+        try:
+            async with session.get(url, headers=headers) as r:
+                if r.status == 304:
+                    entry["fetched_ts"] = time.time()
+                    return cached
+                if r.status == 200:
+                    html = await r.text()
+                    path = cache_path(url)
+                    queue_cache_write(path, html)
+                    index[url] = {
+                        "path": os.path.relpath(path, CACHE_DIR),
+                        "fetched_ts": time.time(),
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }
+                    return html
+                print(f"[WARN] Status {r.status} for {url}")
+                if r.status not in RETRY_STATUSES:
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[WARN] Error fetching {url}: {e}")
+
+    print(f"[ERROR] Failed to fetch {url}")
+    # A stale copy beats nothing when a refresh fails
+    return cached
+
+
+# url -> Task resolving to its HTML; an async stand-in for functools.lru_cache
+# that also lets concurrent callers share one in-flight fetch. Only strings are
+# memoized, never soups, since BeautifulSoup trees are mutable.
+_HTML_MEMO = OrderedDict()
+HTML_MEMO_SIZE = 256
+
+
+def clear_memo():
+    """Forget memoized pages; Tasks are bound to the event loop that made them."""
+    _HTML_MEMO.clear()
+
+
+def _failed(task):
+    return task.done() and (task.cancelled() or task.exception() is not None)
+
+
+async def get_html(session, url, refresh=False):
+    """Return HTML for url, reusing recent or in-flight fetches of the same page."""
+    task = _HTML_MEMO.get(url)
+    if task is None or _failed(task):
+        task = asyncio.ensure_future(fetch_cached(session, url, refresh))
+        _HTML_MEMO[url] = task
+        if len(_HTML_MEMO) > HTML_MEMO_SIZE:
+            _HTML_MEMO.popitem(last=False)
+    else:
+        _HTML_MEMO.move_to_end(url)
+
+    try:
+        html = await task
+    except BaseException:
+        # don't remember errors or cancellations
+        if _HTML_MEMO.get(url) is task:
+            _HTML_MEMO.pop(url)
+        raise
+    if html is None:
+        # don't remember failures
+        _HTML_MEMO.pop(url, None)
+    return html
+
+
+async def bounded_map(func, items, concurrency):
+    """
+    Yield func(item) results as they finish, pulling items lazily so that
+    at most `concurrency` calls (and tasks) exist at any moment.
+    """
+    items = iter(items)
+    pending = set()
+    while True:
+        for item in items:
+            pending.add(asyncio.ensure_future(func(item)))
+            if len(pending) >= concurrency:
+                break
+        if not pending:
+            return
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()